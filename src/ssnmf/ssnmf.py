@@ -56,7 +56,416 @@
 '''
 
 import numpy as np
-from numpy import linalg as la
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+try:
+    from threadpoolctl import ThreadpoolController
+except ImportError:
+    ThreadpoolController = None
+
+_CHUNK = 2**16 #number of entries handled by one thread at a time in the elementwise kernels
+_SPARSE_DENSITY = 0.3 #observation masks W sparser than this are stored in CSR form
+_TILE_ROWS = 256 #least rows (or columns) in a panel, so its products stay GEMM-shaped
+_threadpools = {}
+_blascontroller = None
+
+def _threadpool(numthreads):
+    '''
+    Return a shared pool of numthreads worker threads, or None when numthreads is 1.
+    '''
+    if numthreads <= 1:
+        return None
+    if numthreads not in _threadpools:
+        _threadpools[numthreads] = ThreadPoolExecutor(numthreads)
+    return _threadpools[numthreads]
+
+def _chunked(func, pool, *arrays):
+    '''
+    Apply the in-place elementwise func to equally shaped arrays, in flat chunks on the threads of
+    pool (NumPy releases the GIL inside ufunc loops).  Runs serially if pool is None or the arrays
+    are not C-contiguous.
+    '''
+    if pool is None or not all(a.flags.c_contiguous for a in arrays):
+        func(*arrays)
+        return
+    flat = [a.reshape(-1) for a in arrays]
+    chunks = [slice(j, j + _CHUNK) for j in range(0, flat[0].size, _CHUNK)]
+    list(pool.map(lambda c: func(*[f[c] for f in flat]), chunks))
+
+def _blas_limit():
+    '''
+    Return a context manager limiting BLAS to one thread, or None if threadpoolctl is missing.
+    '''
+    global _blascontroller
+    if ThreadpoolController is None:
+        return None
+    if _blascontroller is None:
+        _blascontroller = ThreadpoolController()
+    return _blascontroller.limit(limits=1, user_api='blas')
+
+def _panels(func, pool, n, width, split=False):
+    '''
+    Call func(p, pool) for slices p covering range(n), one panel per thread of pool, if that leaves
+    every panel at least width long.  BLAS is limited to one thread meanwhile, so the products in
+    func do not oversubscribe the cores.  Otherwise (or without a pool or threadpoolctl) the
+    panels run on the calling thread, in panels of the given width if split and as a single panel
+    if not, and the products use the BLAS threads while the elementwise kernels use the pool.
+    '''
+    numthreads = 1 if pool is None else pool._max_workers
+    limit = _blas_limit() if numthreads > 1 and n >= numthreads * width else None
+    if limit is not None:
+        width = -(-n // numthreads)
+        with limit:
+            list(pool.map(lambda p: func(p, None), [slice(j, min(n, j + width)) for j in range(0, n, width)]))
+    elif split:
+        for j in range(0, n, width):
+            func(slice(j, min(n, j + width)), pool)
+    else:
+        func(slice(0, n), pool)
+
+def _mu_update(F, num, denom, eps, pool=None):
+    '''
+    Apply the multiplicative update F <- F * num / (eps + denom) in place.
+
+    num and denom are used as scratch space and are overwritten, so no further full-size
+    temporaries are allocated for the elementwise part of the update.
+    '''
+    def update(F, num, denom):
+        denom += eps
+        num /= denom
+        F *= num
+
+    if denom.shape == F.shape:
+        _chunked(update, pool, F, num, denom)
+    else:
+        update(F, num, denom)
+
+def _mask(xp, M, P, pool=None, out=None):
+    '''
+    Return the masked product M * P.  For a dense mask M, P is overwritten with the product; for
+    a _SparseMask, the product is written into the CSR matrix out (created if None) instead.
+    '''
+    if isinstance(M, _SparseMask):
+        return M.apply(P, out)
+    _chunked(lambda M, P: xp.multiply(M, P, out=P), pool, M, P)
+    return P
+
+def _matmul(xp, P, Q, out):
+    '''
+    Return P @ Q, written into out.  P or Q may be a masked product in CSR form (see
+    _SparseMask); the sparse product then only touches the stored entries and its result is
+    returned as is rather than copied into out.
+    '''
+    if sparse is not None and (sparse.issparse(P) or sparse.issparse(Q)):
+        return P @ Q
+    return xp.matmul(P, Q, out=out)
+
+def _diffnorm(xp, P, Q):
+    '''
+    Compute ||P - Q||_F, overwriting Q.  P and Q may be masked products in CSR form with the same
+    sparsity pattern (see _SparseMask).
+    '''
+    if sparse is not None and sparse.issparse(Q):
+        P, Q = P.data, Q.data
+    return float(xp.linalg.norm(xp.subtract(P, Q, out=Q)))
+
+class _SparseMask:
+    '''
+    Observation mask stored in CSR form, so masked products only gather the observed entries.
+    All masked products share the sparsity pattern of the mask (including observed zeros).
+    '''
+    def __init__(self, W):
+        self.W = sparse.csr_matrix(W)
+        rows = np.repeat(np.arange(W.shape[0]), np.diff(self.W.indptr))
+        self.flat = rows * W.shape[1] + self.W.indices #flat indices of the observed entries
+
+    def apply(self, P, out=None):
+        '''
+        Return W * P for dense, C-contiguous P as a CSR matrix, written into out if given.
+        '''
+        if out is None:
+            out = self.W.copy()
+        np.take(P.reshape(-1), self.flat, out=out.data)
+        out.data *= self.W.data
+        return out
+
+def _masked_update(xp, F, S, M, MX, FS, num, denom, eps, pool=None, out=None):
+    '''
+    Multiplicative update F *= (MX S^T) / (eps + (M * FS) S^T) with FS = F S, where FS is an
+    m x n scratch buffer.  Rows of F are independent, so for a dense mask the update runs over
+    panels of _TILE_ROWS rows, each masked and multiplied by S^T right after its product F S
+    (thinner panels would turn the products into slow GEMV calls).
+    Returns the masked product buffer (see _mask); for a dense mask it is stale afterwards.
+    '''
+    St = S.T
+    if isinstance(M, _SparseMask):
+        out = M.apply(xp.matmul(F, S, out=FS), out)
+        _mu_update(F, _matmul(xp, MX, St, num), _matmul(xp, out, St, denom), eps, pool)
+        return out
+    rows = FS.shape[0]
+    tile = rows if xp is not np else _TILE_ROWS
+
+    def update(r, pool):
+        FSr = _mask(xp, M[r], xp.matmul(F[r], S, out=FS[r]), pool)
+        _mu_update(F[r], xp.matmul(MX[r], St, out=num[r]), xp.matmul(FSr, St, out=denom[r]), eps, pool)
+
+    _panels(update, pool, rows, tile, split=True)
+    return FS
+
+def _mult_step(xp, A, S, X, W, eps, buf, pool=None):
+    '''
+    One multiplicative update of A and S for the NMF objective (1), in place, using the scratch
+    buffers in buf (W is unused).
+    '''
+    (rows, k), cols = A.shape, S.shape[1]
+    _gram(S, buf['SSt'])
+
+    def updateA(r, pool):
+        _mu_update(A[r], xp.matmul(X[r], S.T, out=buf['numA'][r]), \
+                   xp.matmul(A[r], buf['SSt'], out=buf['denomA'][r]), eps, pool)
+
+    _panels(updateA, pool, rows, _TILE_ROWS)
+    _gram(A.T, buf['AtA'])
+
+    def updateS(c, pool):
+        _mu_update(S[:,c], xp.matmul(A.T, X[:,c], out=buf['numS'][:,c]), \
+                   xp.matmul(buf['AtA'], S[:,c], out=buf['denomS'][:,c]), eps, pool)
+
+    _panels(updateS, pool, cols, _TILE_ROWS)
+
+def _mult_step_W(xp, A, S, X, W, eps, buf, pool=None):
+    '''
+    One multiplicative update of A and S for the NMF objective (1) with observation mask W (an
+    array or a _SparseMask), in place.  buf holds the masked data WX, an m x n scratch buffer AS
+    and the masked product buffer WAS (see _mask) besides the usual scratch buffers (X is unused).
+    '''
+    WX, AS = buf['WX'], buf['AS']
+    WAS = buf['WAS'] = _masked_update(xp, A, S, W, WX, AS, buf['numA'], buf['denomA'], eps, pool, buf['WAS'])
+    if isinstance(W, _SparseMask):
+        WAS = buf['WAS'] = _mask(xp, W, xp.matmul(A, S, out=AS), pool, WAS)
+        _mu_update(S, _matmul(xp, A.T, WX, buf['numS']), \
+                   _matmul(xp, A.T, WAS, buf['denomS']), eps, pool)
+        return
+
+    def update(c, pool):
+        WASc = _mask(xp, W[:,c], xp.matmul(A, S[:,c], out=AS[:,c]), pool)
+        _mu_update(S[:,c], xp.matmul(A.T, WX[:,c], out=buf['numS'][:,c]), \
+                   xp.matmul(A.T, WASc, out=buf['denomS'][:,c]), eps, pool)
+
+    _panels(update, pool, S.shape[1], _TILE_ROWS)
+
+def _labelled_update_S(xp, A, S, B, X, Y, W, L, lam, eps, buf, pool=None, kl=False):
+    '''
+    Multiplicative update of S for the objective (2), or (3) if kl, in place.  X and Y are the data
+    and labels, already masked by W and L where these are given.  Columns of S are independent, so
+    the update runs over column panels (see _panels); for a _SparseMask W only the products with
+    the masked data run whole beforehand.
+    '''
+    numS, denomS, bufS, BS = buf['numS'], buf['denomS'], buf['bufS'], buf['BS']
+    AtA, BtB, AS = buf['AtA'], buf['BtB'], buf.get('AS')
+    lamBt = lam * B.T
+    if L is None:
+        if kl:
+            lamBsum = lam * B.sum(axis=0)[:,np.newaxis]
+        else:
+            _gram(B.T, BtB)
+            BtB *= lam
+    if W is None:
+        _gram(A.T, AtA)
+        if not kl and L is None:
+            #the S update then needs only the k x k Gram matrix A^T A + lam B^T B
+            AtA += BtB
+    elif isinstance(W, _SparseMask):
+        numS = _matmul(xp, A.T, X, numS)
+        WAS = buf['WAS'] = _mask(xp, W, xp.matmul(A, S, out=AS), pool, buf['WAS'])
+        denomS = _matmul(xp, A.T, WAS, denomS)
+
+    def update(c, pool):
+        num, denom, scratch = numS[:,c], denomS[:,c], bufS[:,c]
+        if W is None:
+            xp.matmul(A.T, X[:,c], out=num)
+            xp.matmul(AtA, S[:,c], out=denom)
+        elif not isinstance(W, _SparseMask):
+            xp.matmul(A.T, X[:,c], out=num)
+            xp.matmul(A.T, _mask(xp, W[:,c], xp.matmul(A, S[:,c], out=AS[:,c]), pool), out=denom)
+        if kl:
+            #I-divergence terms, with Y / (eps + BS) formed in the BS buffer
+            BSc = xp.matmul(B, S[:,c], out=BS[:,c])
+            if L is not None:
+                _mask(xp, L[:,c], BSc, pool)
+            BSc += eps
+            xp.divide(Y[:,c], BSc, out=BSc)
+            num *= 2
+            num += xp.matmul(lamBt, BSc, out=scratch)
+            denom *= 2
+            denom += lamBsum if L is None else xp.matmul(lamBt, L[:,c], out=scratch)
+            _mu_update(S[:,c], num, denom, eps, pool)
+            return
+        num += xp.matmul(lamBt, Y[:,c], out=scratch)
+        if L is not None:
+            BSc = _mask(xp, L[:,c], xp.matmul(B, S[:,c], out=BS[:,c]), pool)
+            denom += xp.matmul(lamBt, BSc, out=scratch)
+        elif W is not None:
+            denom += xp.matmul(BtB, S[:,c], out=scratch)
+        _mu_update(S[:,c], num, denom, eps, pool)
+
+    _panels(update, pool, S.shape[1], _TILE_ROWS)
+
+def _snmf_step(xp, A, S, B, X, Y, W, L, lam, eps, buf, pool=None):
+    '''
+    One multiplicative update of A, B and S for the objective (2), in place, using the scratch
+    buffers in buf (W and L are unused).
+    '''
+    SSt = buf['SSt']
+    _gram(S, SSt)
+    _mu_update(A, xp.matmul(X, S.T, out=buf['numA']), xp.matmul(A, SSt, out=buf['denomA']), eps, pool)
+    _mu_update(B, xp.matmul(Y, S.T, out=buf['numB']), xp.matmul(B, SSt, out=buf['denomB']), eps, pool)
+    _labelled_update_S(xp, A, S, B, X, Y, None, None, lam, eps, buf, pool)
+
+def _snmf_step_L(xp, A, S, B, X, Y, W, L, lam, eps, buf, pool=None):
+    '''
+    One multiplicative update of A, B and S for the objective (2) with label mask L, in place.
+    buf holds the masked labels LY besides the usual scratch buffers (W is unused).
+    '''
+    SSt, LY, BS = buf['SSt'], buf['LY'], buf['BS']
+    _gram(S, SSt)
+    _mu_update(A, xp.matmul(X, S.T, out=buf['numA']), xp.matmul(A, SSt, out=buf['denomA']), eps, pool)
+    _mask(xp, L, xp.matmul(B, S, out=BS), pool)
+    _mu_update(B, xp.matmul(LY, S.T, out=buf['numB']), xp.matmul(BS, S.T, out=buf['denomB']), eps, pool)
+    _labelled_update_S(xp, A, S, B, X, LY, None, L, lam, eps, buf, pool)
+
+def _snmf_step_W(xp, A, S, B, X, Y, W, L, lam, eps, buf, pool=None):
+    '''
+    One multiplicative update of A, B and S for the objective (2) with observation mask W (an
+    array or a _SparseMask), in place.  buf holds WX, AS and WAS as for _mult_step_W besides the
+    usual scratch buffers (X and L are unused).
+    '''
+    SSt, WX = buf['SSt'], buf['WX']
+    _gram(S, SSt)
+    buf['WAS'] = _masked_update(xp, A, S, W, WX, buf['AS'], buf['numA'], buf['denomA'], eps, pool, buf['WAS'])
+    _mu_update(B, xp.matmul(Y, S.T, out=buf['numB']), xp.matmul(B, SSt, out=buf['denomB']), eps, pool)
+    _labelled_update_S(xp, A, S, B, WX, Y, W, None, lam, eps, buf, pool)
+
+def _snmf_step_WL(xp, A, S, B, X, Y, W, L, lam, eps, buf, pool=None):
+    '''
+    One multiplicative update of A, B and S for the objective (2) with observation mask W and
+    label mask L, in place (see _snmf_step_W and _snmf_step_L; X is unused).
+    '''
+    WX, LY, BS = buf['WX'], buf['LY'], buf['BS']
+    buf['WAS'] = _masked_update(xp, A, S, W, WX, buf['AS'], buf['numA'], buf['denomA'], eps, pool, buf['WAS'])
+    _mask(xp, L, xp.matmul(B, S, out=BS), pool)
+    _mu_update(B, xp.matmul(LY, S.T, out=buf['numB']), xp.matmul(BS, S.T, out=buf['denomB']), eps, pool)
+    _labelled_update_S(xp, A, S, B, WX, LY, W, L, lam, eps, buf, pool)
+
+def _klsnmf_step(xp, A, S, B, X, Y, W, L, lam, eps, buf, pool=None):
+    '''
+    One multiplicative update of A, B and S for the objective (3), in place, using the scratch
+    buffers in buf (W and L are unused).  1 @ S^T and B^T @ 1 in the updates are the row sums of
+    S and column sums of B, broadcast.
+    '''
+    SSt, BS = buf['SSt'], buf['BS']
+    _gram(S, SSt)
+    _mu_update(A, xp.matmul(X, S.T, out=buf['numA']), xp.matmul(A, SSt, out=buf['denomA']), eps, pool)
+    xp.matmul(B, S, out=BS)
+    BS += eps
+    xp.divide(Y, BS, out=BS)
+    _mu_update(B, xp.matmul(BS, S.T, out=buf['numB']), S.sum(axis=1)[np.newaxis,:], eps, pool)
+    _labelled_update_S(xp, A, S, B, X, Y, None, None, lam, eps, buf, pool, kl=True)
+
+def _klsnmf_step_L(xp, A, S, B, X, Y, W, L, lam, eps, buf, pool=None):
+    '''
+    One multiplicative update of A, B and S for the objective (3) with label mask L, in place.
+    buf holds the masked labels LY besides the usual scratch buffers (W is unused).
+    '''
+    SSt, LY, BS = buf['SSt'], buf['LY'], buf['BS']
+    _gram(S, SSt)
+    _mu_update(A, xp.matmul(X, S.T, out=buf['numA']), xp.matmul(A, SSt, out=buf['denomA']), eps, pool)
+    _mask(xp, L, xp.matmul(B, S, out=BS), pool)
+    BS += eps
+    xp.divide(LY, BS, out=BS)
+    _mu_update(B, xp.matmul(BS, S.T, out=buf['numB']), xp.matmul(L, S.T, out=buf['denomB']), eps, pool)
+    _labelled_update_S(xp, A, S, B, X, LY, None, L, lam, eps, buf, pool, kl=True)
+
+def _klsnmf_step_W(xp, A, S, B, X, Y, W, L, lam, eps, buf, pool=None):
+    '''
+    One multiplicative update of A, B and S for the objective (3) with observation mask W, in
+    place (see _snmf_step_W and _klsnmf_step; X and L are unused).
+    '''
+    WX, BS = buf['WX'], buf['BS']
+    buf['WAS'] = _masked_update(xp, A, S, W, WX, buf['AS'], buf['numA'], buf['denomA'], eps, pool, buf['WAS'])
+    xp.matmul(B, S, out=BS)
+    BS += eps
+    xp.divide(Y, BS, out=BS)
+    _mu_update(B, xp.matmul(BS, S.T, out=buf['numB']), S.sum(axis=1)[np.newaxis,:], eps, pool)
+    _labelled_update_S(xp, A, S, B, WX, Y, W, None, lam, eps, buf, pool, kl=True)
+
+def _klsnmf_step_WL(xp, A, S, B, X, Y, W, L, lam, eps, buf, pool=None):
+    '''
+    One multiplicative update of A, B and S for the objective (3) with observation mask W and
+    label mask L, in place (see _snmf_step_W and _klsnmf_step_L; X is unused).
+    '''
+    WX, LY, BS = buf['WX'], buf['LY'], buf['BS']
+    buf['WAS'] = _masked_update(xp, A, S, W, WX, buf['AS'], buf['numA'], buf['denomA'], eps, pool, buf['WAS'])
+    _mask(xp, L, xp.matmul(B, S, out=BS), pool)
+    BS += eps
+    xp.divide(LY, BS, out=BS)
+    _mu_update(B, xp.matmul(BS, S.T, out=buf['numB']), xp.matmul(L, S.T, out=buf['denomB']), eps, pool)
+    _labelled_update_S(xp, A, S, B, WX, LY, W, L, lam, eps, buf, pool, kl=True)
+
+#update steps of snmfmult and klsnmfmult, by whether the data (W) and labels (L) are masked
+_SNMF_STEPS = {(False, False): _snmf_step, (False, True): _snmf_step_L,
+               (True, False): _snmf_step_W, (True, True): _snmf_step_WL}
+_KLSNMF_STEPS = {(False, False): _klsnmf_step, (False, True): _klsnmf_step_L,
+                 (True, False): _klsnmf_step_W, (True, True): _klsnmf_step_WL}
+
+def _reconerr(xp, A, S, X, W, buf, pool=None):
+    '''
+    Return ||X - AS||_F, using buf['AS'] as scratch space (W is unused).
+    '''
+    return _residual(xp, X, A, S, buf['AS'])
+
+def _reconerr_W(xp, A, S, X, W, buf, pool=None):
+    '''
+    Return ||W * (X - AS)||_F, using the masked data and product buffers in buf (X is unused).
+    '''
+    WAS = buf['WAS'] = _mask(xp, W, xp.matmul(A, S, out=buf['AS']), pool, buf['WAS'])
+    return _diffnorm(xp, buf['WX'], WAS)
+
+def _classerr(xp, B, S, Y, L, buf, pool=None):
+    '''
+    Return ||Y - BS||_F, using buf['BS'] as scratch space (L is unused).
+    '''
+    BS = xp.matmul(B, S, out=buf['BS'])
+    return float(xp.linalg.norm(xp.subtract(Y, BS, out=BS), 'fro'))
+
+def _classerr_L(xp, B, S, Y, L, buf, pool=None):
+    '''
+    Return ||L * (Y - BS)||_F, using the masked labels and buf['BS'] (Y is unused).
+    '''
+    BS = _mask(xp, L, xp.matmul(B, S, out=buf['BS']), pool)
+    return float(xp.linalg.norm(xp.subtract(buf['LY'], BS, out=BS), 'fro'))
+
+def _gram(F, out):
+    '''
+    Write the Gram matrix F F^T into out and return it.
+
+    Both operands are views of the same array, which NumPy's matmul evaluates with BLAS syrk (half
+    the flops of gemm), so F should be passed as is rather than copied.
+    '''
+    out[...] = F @ F.T
+    return out
+
+def _residual(xp, X, A, S, AS):
+    '''
+    Compute ||X - AS||_F, using the m x n buffer AS as scratch space.  The squared entries of the
+    residual are summed in double precision.
+    '''
+    R = xp.subtract(X, xp.matmul(A, S, out=AS), out=AS)
+    xp.square(R, out=R)
+    return float(R.sum(dtype=np.float64)) ** 0.5
 
 class SSNMF:
 
@@ -76,13 +485,14 @@ class SSNMF:
     Parameters
     ----------
     X : array
-        Data matrix of size m x n.
+        Data matrix of size m x n.  A scipy.sparse matrix is accepted and stored densely.
     k : int_
         Number of topics.
     Y : array, optional
         Label matrix of size p x n (default is None).
     W : array, optional
         Binary matrix of size p x n, whether the data is observed or not (default is None).
+        Masks with few observed entries are handled in sparse form when scipy is available.
     L : array, optional
         Binary matrix of size m x n, whether the label is known or not (default is None).
     lam : float_, optional
@@ -97,6 +507,13 @@ class SSNMF:
     B : array, optional
         Initialization for left factor matrix of Y of size p x k (the default is a matrix with
         uniform random entries if Y is not None, None otherwise).
+    dtype : data-type, optional
+        Floating point type in which the data, label, mask, and factor matrices are stored and
+        trained (default is numpy.float32).
+    backend : str, optional
+        Array library holding the matrices, 'numpy' or 'cupy' (default is 'numpy').  With
+        'cupy' the matrices stay resident in GPU memory for the whole training run and the
+        products run on cuBLAS; only the saved errors are copied back to the host.
 
 
     Methods
@@ -114,37 +531,58 @@ class SSNMF:
 
     """
     def __init__(self, X, k, **kwargs):
-        self.X = X
-        rows = np.shape(X)[0]
-        cols = np.shape(X)[1]
-        self.A = kwargs.get('A',np.random.rand(rows,k)) #initialize factor A
-        self.S = kwargs.get('S',np.random.rand(k,cols)) #initialize factor S
+        #keep data C-contiguous so the products in the updates go straight to BLAS (transposed
+        #operands are passed as views with a transpose flag rather than copied)
+        self.dtype = np.dtype(kwargs.get('dtype', np.float32))
+        self.backend = kwargs.get('backend', 'numpy')
+        if self.backend == 'numpy':
+            self.xp = np
+        elif self.backend == 'cupy':
+            try:
+                import cupy
+            except ImportError:
+                raise Exception('Backend cupy requested but CuPy is not installed.')
+            self.xp = cupy
+        else:
+            raise Exception('Unknown backend: use numpy or cupy.')
+        xp = self.xp
+
+        #the updates run on dense arrays, so densify a scipy.sparse data matrix up front
+        if sparse is not None and sparse.issparse(X):
+            X = X.toarray()
+        self.X = xp.asarray(X, dtype=self.dtype, order='C')
+        rows = self.X.shape[0]
+        cols = self.X.shape[1]
+        #factors are updated in place, so keep our own C-contiguous copies
+        self.A = xp.array(kwargs.get('A',np.random.rand(rows,k)), dtype=self.dtype, order='C') #initialize factor A
+        self.S = xp.array(kwargs.get('S',np.random.rand(k,cols)), dtype=self.dtype, order='C') #initialize factor S
 
         #check dimensions of X, A, and S match
-        if rows != np.shape(self.A)[0]:
+        if rows != self.A.shape[0]:
             raise Exception('The row dimensions of X and A are not equal.')
-        if cols != np.shape(self.S)[1]:
+        if cols != self.S.shape[1]:
             raise Exception('The column dimensions of X and S are not equal.')
-        if np.shape(self.A)[1] != k:
+        if self.A.shape[1] != k:
             raise Exception('The column dimension of A is not equal to the input number of topics.')
-        if np.shape(self.S)[0] != k:
+        if self.S.shape[0] != k:
             raise Exception('The row dimension of S is not equal to the input number of topics.')
 
         #supervision initializations (optional)
         self.Y = kwargs.get('Y',None)
         if self.Y is not None:
+            self.Y = xp.asarray(self.Y, dtype=self.dtype, order='C')
             #check dimensions of X and Y match
-            if np.shape(self.Y)[1] != np.shape(self.X)[1]:
+            if self.Y.shape[1] != self.X.shape[1]:
                 raise Exception('The column dimensions of X and Y are not equal.')
 
-            classes = np.shape(self.Y)[0]
-            self.B = kwargs.get('B',np.random.rand(classes,k))
-            self.lam = kwargs.get('lam',1)
+            classes = self.Y.shape[0]
+            self.B = xp.array(kwargs.get('B',np.random.rand(classes,k)), dtype=self.dtype, order='C')
+            self.lam = self.dtype.type(kwargs.get('lam',1))
 
             #check dimensions of Y, S, and B match
-            if np.shape(self.B)[0] != classes:
+            if self.B.shape[0] != classes:
                 raise Exception('The row dimensions of Y and B are not equal.')
-            if np.shape(self.B)[1] != k:
+            if self.B.shape[1] != k:
                 raise Exception('The column dimension of B is not equal to the input number of topics.')
         else:
             self.B = None
@@ -153,21 +591,73 @@ class SSNMF:
         # missing data (optional)
         self.W = kwargs.get('W',None)
         if self.W is not None:
+            self.W = xp.asarray(self.W, dtype=self.dtype, order='C')
             #check dimensions of X and W match
-            if np.shape(self.W)[0] != np.shape(self.X)[0]:
+            if self.W.shape[0] != self.X.shape[0]:
                 raise Exception('The row dimensions of X and W are not equal.')
-            if np.shape(self.W)[1] != np.shape(self.X)[1]:
+            if self.W.shape[1] != self.X.shape[1]:
                 raise Exception('The column dimensions of X and W are not equal.')
 
+        #a sparse observation mask is also kept in CSR form (needs scipy, host arrays only)
+        self._Wsp = None
+        if self.W is not None and sparse is not None and xp is np and self.W.mean() < _SPARSE_DENSITY:
+            self._Wsp = _SparseMask(self.W)
+
         # missing labels, semi-supervision (optional)
         self.L = kwargs.get('L',None)
         if self.L is not None:
+            self.L = xp.asarray(self.L, dtype=self.dtype, order='C')
             #check dimensions of Y and L match
-            if np.shape(self.L)[0] != np.shape(self.Y)[0]:
+            if self.L.shape[0] != self.Y.shape[0]:
                 raise Exception('The row dimensions of Y and L are not equal.')
-            if np.shape(self.L)[1] != np.shape(self.Y)[1]:
+            if self.L.shape[1] != self.Y.shape[1]:
                 raise Exception('The column dimensions of Y and L are not equal.')
 
+        #update and error steps, specialized to whether the data and labels are masked
+        masked = (self.W is not None, self.L is not None)
+        self._mult_step = _mult_step_W if masked[0] else _mult_step
+        self._snmf_step = _SNMF_STEPS[masked]
+        self._klsnmf_step = _KLSNMF_STEPS[masked]
+        self._reconerr = _reconerr_W if masked[0] else _reconerr
+        self._classerr = _classerr_L if masked[1] else _classerr
+
+    def _buffers(self, saveerrs, pool, labels=False):
+        '''
+        Return the scratch buffers for the update and error steps, reused across iterations.
+        '''
+        xp = self.xp
+        rows, k = self.A.shape
+        cols = self.S.shape[1]
+        buf = {'SSt': xp.empty((k,k), dtype=self.dtype),
+               'AtA': xp.empty((k,k), dtype=self.dtype),
+               'numA': xp.empty((rows,k), dtype=self.dtype),
+               'denomA': xp.empty((rows,k), dtype=self.dtype),
+               'numS': xp.empty((k,cols), dtype=self.dtype),
+               'denomS': xp.empty((k,cols), dtype=self.dtype)}
+
+        if labels:
+            classes = self.Y.shape[0]
+            buf.update({'BtB': xp.empty((k,k), dtype=self.dtype),
+                        'numB': xp.empty((classes,k), dtype=self.dtype),
+                        'denomB': xp.empty((classes,k), dtype=self.dtype),
+                        'bufS': xp.empty((k,cols), dtype=self.dtype),
+                        'BS': xp.empty((classes,cols), dtype=self.dtype)})
+            if self.L is not None:
+                #masked labels are constant; masked products L*(BS) are written into the BS buffer
+                buf['LY'] = xp.multiply(self.L, self.Y)
+
+        if self.W is not None:
+            #masked data is constant; masked products W*(AS) are written into the AS buffer, or into WAS
+            #in CSR form for a sparse mask
+            W = self.W if self._Wsp is None else self._Wsp
+            buf['WX'] = _mask(xp, W, xp.array(self.X), pool)
+            buf['AS'] = xp.empty((rows,cols), dtype=self.dtype)
+            buf['WAS'] = None
+        elif saveerrs:
+            #scratch buffer for the reconstruction errors
+            buf['AS'] = xp.empty((rows,cols), dtype=self.dtype)
+        return buf
+
     def mult(self,**kwargs):
         '''
         Multiplicative updates for training unsupervised NMF model (1).
@@ -178,52 +668,51 @@ class SSNMF:
             Number of iterations of updates to run (default is 10).
         saveerrs : bool, optional
             Boolean indicating whether to save model errors during iterations.
+        errevery : int_, optional
+            Number of iterations between saved errors (default is 1); errors are also saved after
+            the last iteration.
         eps : float_, optional
             Epsilon value to prevent division by zero (default is 1e-10).
+        numthreads : int_, optional
+            Number of threads sharing the elementwise (masking and update) steps (default is 1).
+            With threadpoolctl installed, the updates of A and S are also split over panels of
+            rows and columns on these threads, with BLAS limited to one thread per panel.
 
         Returns
         -------
         errs : array, optional
-            If saveerrs, returns array of ||X - AS||_F for each iteration (length numiters).
+            If saveerrs, returns array of ||X - AS||_F every errevery iterations (length
+            ceil(numiters/errevery)).
         '''
         numiters = kwargs.get('numiters', 1000)
         saveerrs = kwargs.get('saveerrs', False)
-        eps = kwargs.get('eps', 1e-10)
+        errevery = kwargs.get('errevery', 1)
+        eps = self.dtype.type(kwargs.get('eps', 1e-10))
+        xp = self.xp
+        #elementwise kernels on the GPU are already parallel, only use threads on the host
+        pool = _threadpool(kwargs.get('numthreads', 1)) if xp is np else None
 
         if saveerrs:
-            errs = np.empty(numiters) #initialize error array
+            numerrs = -(-numiters // errevery) #errors are saved every errevery iterations and after the last
+            errs = np.empty(numerrs) #initialize error array
 
-        if self.W is None:
-            for i in range(numiters):
-                #multiplicative updates for A and S
-                self.A = np.multiply(np.divide(self.A,eps+ self.A @ self.S @ np.transpose(self.S)), \
-                                 self.X @ np.transpose(self.S))
-                self.S = np.multiply(np.divide(self.S,eps+ np.transpose(self.A) @ self.A @ self.S), \
-                                 np.transpose(self.A) @ self.X)
+        W = self.W if self._Wsp is None else self._Wsp
+        buf = self._buffers(saveerrs, pool)
+        for i in range(numiters):
+            saveerr = saveerrs and ((i+1) % errevery == 0 or i == numiters-1)
+            #multiplicative updates for A and S
+            self._mult_step(xp, self.A, self.S, self.X, W, eps, buf, pool)
 
-                if saveerrs:
-                    errs[i] = la.norm(self.X - self.A @ self.S, 'fro') #save reconstruction error
+            if saveerr:
+                errs[i // errevery] = self._reconerr(xp, self.A, self.S, self.X, W, buf, pool) #save reconstruction error
 
+        if self.W is None:
             print("Completed NMF for unsupervised learning without missing data.")
-
-            if saveerrs:
-                return [errs]
-
-        elif self.W is not None:
-            for i in range(numiters):
-                #multiplicative updates for A and S
-                self.A = np.multiply(np.divide(self.A,eps+ np.multiply(self.W, self.A @ self.S) @ np.transpose(self.S)), \
-                                 np.multiply(self.W,self.X) @ np.transpose(self.S))
-                self.S = np.multiply(np.divide(self.S,eps+ np.transpose(self.A) @ np.multiply(self.W,self.A @ self.S)), \
-                                 np.transpose(self.A) @ np.multiply(self.W,self.X))
-
-                if saveerrs:
-                    errs[i] = la.norm(np.multiply(self.W,self.X) - np.multiply(self.W, self.A @ self.S), 'fro') #save reconstruction error
-
+        else:
             print("Completed NMF for unsupervised learning with missing data.")
 
-            if saveerrs:
-                return [errs]
+        if saveerrs:
+            return [errs]
 
     def snmfmult(self,**kwargs):
         '''
@@ -235,133 +724,69 @@ class SSNMF:
             Number of iterations of updates to run (default is 10).
         saveerrs : bool, optional
             Boolean indicating whether to save model errors during iterations.
+        errevery : int_, optional
+            Number of iterations between saved errors (default is 1); errors are also saved after
+            the last iteration.
         eps : float_, optional
             Epsilon value to prevent division by zero (default is 1e-10).
+        numthreads : int_, optional
+            Number of threads sharing the elementwise (masking and update) steps (default is 1).
+            With threadpoolctl installed and a mask W, the update of A is also split over panels
+            of rows on these threads, with BLAS limited to one thread per panel.
 
         Returns
         -------
         errs : array, optional
-            If saveerrs, returns array of ||X - AS||_F^2 + lam ||Y - BS||_F^2 for each
-            iteration (length numiters).
+            If saveerrs, returns array of ||X - AS||_F^2 + lam ||Y - BS||_F^2 every
+            errevery iterations (length ceil(numiters/errevery)).
         reconerrs : array, optional
-            If saveerrs, returns array of ||X - AS||_F for each iteration (length numiters).
+            If saveerrs, returns array of ||X - AS||_F every errevery iterations (length
+            ceil(numiters/errevery)).
         classerrs : array, optional
-            If saveerrs, returns array of ||Y - BS||_F for each iteration (length numiters).
+            If saveerrs, returns array of ||Y - BS||_F every errevery iterations (length
+            ceil(numiters/errevery)).
         classaccs : array, optional
-            If saveerrs, returns array of classification accuracy (computed with Y, B, S) at each
-            iteration (length numiters).
+            If saveerrs, returns array of classification accuracy (computed with Y, B, S) every
+            errevery iterations (length ceil(numiters/errevery)).
         '''
         numiters = kwargs.get('numiters', 1000)
         saveerrs = kwargs.get('saveerrs', False)
-        eps = kwargs.get('eps', 1e-10)
-
+        errevery = kwargs.get('errevery', 1)
+        eps = self.dtype.type(kwargs.get('eps', 1e-10))
+        xp = self.xp
+        #elementwise kernels on the GPU are already parallel, only use threads on the host
+        pool = _threadpool(kwargs.get('numthreads', 1)) if xp is np else None
 
         if saveerrs:
-            errs = np.empty(numiters) #initialize error array
-            reconerrs = np.empty(numiters)
-            classerrs = np.empty(numiters)
-            classaccs = np.empty(numiters)
+            numerrs = -(-numiters // errevery) #errors are saved every errevery iterations and after the last
+            errs = np.empty(numerrs) #initialize error array
+            reconerrs = np.empty(numerrs)
+            classerrs = np.empty(numerrs)
+            classaccs = np.empty(numerrs)
 
         if self.Y is None:
             #if no label matrix provided, train unsupervised model instead
             raise Exception('Label matrix Y not provided: train with mult instead.')
 
-        if self.L is None and self.W is None:
-            # supervised learning, without missing data
-            for i in range(numiters):
-                #multiplicative updates for A, S, and B
-                self.A = np.multiply(np.divide(self.A,eps+ self.A @ self.S @ np.transpose(self.S)), \
-                                    self.X @ np.transpose(self.S))
-                self.B = np.multiply(np.divide(self.B, eps+ self.B @ self.S @ np.transpose(self.S)), \
-                                    self.Y @ np.transpose(self.S))
-                self.S = np.multiply(np.divide(self.S, eps+ np.transpose(self.A) @ self.A @ self.S + \
-                                    self.lam * np.transpose(self.B) @ self.B @ self.S), \
-                                    np.transpose(self.A) @ self.X + self.lam * np.transpose(self.B) \
-                                    @ self.Y)
-
-                if saveerrs:
-                    reconerrs[i] = la.norm(self.X - self.A @ self.S, 'fro')
-                    classerrs[i] = la.norm(self.Y - self.B @ self.S, 'fro')
-                    errs[i] = reconerrs[i]**2 + self.lam * classerrs[i]**2 #save errors
-                    classaccs[i] = self.accuracy()
-
-            print("Completed SSNMF for supervised learning without missing data.")
-
-            if saveerrs:
-                return [errs,reconerrs,classerrs,classaccs]
-
-
-        elif self.L is not None and self.W is None:
-            # semi-supervised learning, without missing data
-            for i in range(numiters):
-                #multiplicative updates for A, S, and B
-                self.A = np.multiply(np.divide(self.A,eps+ self.A @ self.S @ np.transpose(self.S)), \
-                                    self.X @ np.transpose(self.S))
-                self.B = np.multiply(np.divide(self.B, eps+ np.multiply(self.L,self.B @ self.S) @ np.transpose(self.S)), \
-                                    np.multiply(self.L,self.Y) @ np.transpose(self.S))
-                self.S = np.multiply(np.divide(self.S, eps+ np.transpose(self.A) @ self.A @ self.S + \
-                                    self.lam * np.transpose(self.B) @ np.multiply(self.L,self.B @ self.S)), \
-                                    np.transpose(self.A) @ self.X + self.lam * np.transpose(self.B) \
-                                    @ np.multiply(self.L,self.Y))
-                if saveerrs:
-                    reconerrs[i] = la.norm(self.X - self.A @ self.S, 'fro')
-                    classerrs[i] = la.norm(np.multiply(self.L,self.Y) - np.multiply(self.L,self.B @ self.S), 'fro')
-                    errs[i] = reconerrs[i]**2 + self.lam * classerrs[i]**2 #save errors
-                    classaccs[i] = self.accuracy()
-
-            print("Completed SSNMF for semi-supervised learning without missing data.")
-
-            if saveerrs:
-                return [errs,reconerrs,classerrs,classaccs]
-
-
-        elif self.L is None and self.W is not None:
-            # supervised learning, with missing data
-            for i in range(numiters):
-                #multiplicative updates for A, S, and B
-                self.A = np.multiply(np.divide(self.A,eps+ np.multiply(self.W, self.A @ self.S) @ np.transpose(self.S)), \
-                                    np.multiply(self.W,self.X) @ np.transpose(self.S))
-                self.B = np.multiply(np.divide(self.B, eps+ self.B @ self.S @ np.transpose(self.S)), \
-                                    self.Y @ np.transpose(self.S))
-                self.S = np.multiply(np.divide(self.S, eps+ np.transpose(self.A) @ np.multiply(self.W, self.A @ self.S) + \
-                                    self.lam * np.transpose(self.B) @ self.B @ self.S), \
-                                np.transpose(self.A) @ np.multiply(self.W, self.X) + self.lam * np.transpose(self.B) \
-                                @ self.Y)
-                if saveerrs:
-                    reconerrs[i] = la.norm(np.multiply(self.W, self.X) - np.multiply(self.W, self.A @ self.S), 'fro')
-                    classerrs[i] = la.norm(self.Y - self.B @ self.S, 'fro')
-                    errs[i] = reconerrs[i]**2 + self.lam * classerrs[i]**2 #save errors
-                    classaccs[i] = self.accuracy()
-
-            print("Completed SSNMF for supervised learning with missing data.")
-
-            if saveerrs:
-                return [errs,reconerrs,classerrs,classaccs]
-
-
-        elif self.W is not None and self.L is not None:
-            # semisupervised learning, with missing data
-            for i in range(numiters):
-                #multiplicative updates for A, S, and B
-                self.A = np.multiply(np.divide(self.A,eps+ np.multiply(self.W, self.A @ self.S) @ np.transpose(self.S)), \
-                                    np.multiply(self.W,self.X) @ np.transpose(self.S))
-                self.B = np.multiply(np.divide(self.B, eps+ np.multiply(self.L, self.B @ self.S) @ np.transpose(self.S)), \
-                                    np.multiply(self.L, self.Y) @ np.transpose(self.S))
-                self.S = np.multiply(np.divide(self.S, eps+ np.transpose(self.A) @ np.multiply(self.W, self.A @ self.S) + \
-                                    self.lam * np.transpose(self.B) @ np.multiply(self.L,self.B @ self.S)), \
-                                np.transpose(self.A) @ np.multiply(self.W, self.X) + self.lam * np.transpose(self.B) \
-                                @np.multiply(self.L, self.Y))
-                if saveerrs:
-                    reconerrs[i] = la.norm(np.multiply(self.W, self.X) - np.multiply(self.W, self.A @ self.S), 'fro')
-                    classerrs[i] = la.norm(np.multiply(self.L, self.Y) - np.multiply(self.L, self.B @ self.S), 'fro')
-                    errs[i] = reconerrs[i]**2 + self.lam * classerrs[i]**2 #save errors
-                    classaccs[i] = self.accuracy()
-
-            print("Completed SSNMF for semi-supervised learning with missing data.")
-
-            if saveerrs:
-                return [errs,reconerrs,classerrs,classaccs]
+        W = self.W if self._Wsp is None else self._Wsp
+        buf = self._buffers(saveerrs, pool, labels=True)
+        for i in range(numiters):
+            saveerr = saveerrs and ((i+1) % errevery == 0 or i == numiters-1)
+            #multiplicative updates for A, S, and B
+            self._snmf_step(xp, self.A, self.S, self.B, self.X, self.Y, W, self.L, self.lam, eps, buf, pool)
 
+            if saveerr:
+                j = i // errevery
+                reconerrs[j] = self._reconerr(xp, self.A, self.S, self.X, W, buf, pool)
+                classerrs[j] = self._classerr(xp, self.B, self.S, self.Y, self.L, buf, pool)
+                errs[j] = reconerrs[j]**2 + self.lam * classerrs[j]**2 #save errors
+                classaccs[j] = self.accuracy()
+
+        print("Completed SSNMF for %s learning %s missing data." % \
+              ('supervised' if self.L is None else 'semi-supervised', 'without' if self.W is None else 'with'))
+
+        if saveerrs:
+            return [errs,reconerrs,classerrs,classaccs]
 
     def klsnmfmult(self,**kwargs):
         '''
@@ -373,136 +798,69 @@ class SSNMF:
             Number of iterations of updates to run (default is 10).
         saveerrs : bool, optional
             Boolean indicating whether to save model errors during iterations.
+        errevery : int_, optional
+            Number of iterations between saved errors (default is 1); errors are also saved after
+            the last iteration.
         eps : float_, optional
             Epsilon value to prevent division by zero (default is 1e-10).
+        numthreads : int_, optional
+            Number of threads sharing the elementwise (masking and update) steps (default is 1).
+            With threadpoolctl installed and a mask W, the update of A is also split over panels
+            of rows on these threads, with BLAS limited to one thread per panel.
 
         Returns
         -------
         errs : array, optional
-            If saveerrs, returns array of ||X - AS||_F^2 + lam D(Y||BS) for each
-            iteration (length numiters).
+            If saveerrs, returns array of ||X - AS||_F^2 + lam D(Y||BS) every
+            errevery iterations (length ceil(numiters/errevery)).
         reconerrs : array, optional
-            If saveerrs, returns array of ||X - AS||_F for each iteration (length numiters).
+            If saveerrs, returns array of ||X - AS||_F every errevery iterations (length
+            ceil(numiters/errevery)).
         classerrs : array, optional
-            If saveerrs, returns array of D(Y||BS) for each iteration (length numiters).
+            If saveerrs, returns array of D(Y||BS) every errevery iterations (length
+            ceil(numiters/errevery)).
         classaccs : array, optional
-            If saveerrs, returns array of classification accuracy (computed with Y, B, S) at each
-            iteration (length numiters).
+            If saveerrs, returns array of classification accuracy (computed with Y, B, S) every
+            errevery iterations (length ceil(numiters/errevery)).
         '''
         numiters = kwargs.get('numiters', 1000)
         saveerrs = kwargs.get('saveerrs', False)
-        eps = kwargs.get('eps', 1e-10)
-
+        errevery = kwargs.get('errevery', 1)
+        eps = self.dtype.type(kwargs.get('eps', 1e-10))
+        xp = self.xp
+        #elementwise kernels on the GPU are already parallel, only use threads on the host
+        pool = _threadpool(kwargs.get('numthreads', 1)) if xp is np else None
 
         if saveerrs:
-            errs = np.empty(numiters) #initialize error array
-            reconerrs = np.empty(numiters)
-            classerrs = np.empty(numiters)
-            classaccs = np.empty(numiters)
+            numerrs = -(-numiters // errevery) #errors are saved every errevery iterations and after the last
+            errs = np.empty(numerrs) #initialize error array
+            reconerrs = np.empty(numerrs)
+            classerrs = np.empty(numerrs)
+            classaccs = np.empty(numerrs)
 
         if self.Y is None:
             #if no label matrix provided, train unsupervised model instead
             raise Exception('Label matrix Y not provided: train with mult instead.')
 
-        classes = np.shape(self.Y)[0]
-        cols = np.shape(self.Y)[1]
-
-        if self.L is None and self.W is None:
-            for i in range(numiters):
-                #multiplicative updates for A, S, and B
-                self.A = np.multiply(np.divide(self.A,eps+ self.A @ self.S @ np.transpose(self.S)), \
-                                     self.X @ np.transpose(self.S))
-                self.B = np.multiply(np.divide(self.B,eps+ np.ones((classes,cols)) @ np.transpose(self.S)), \
-                                     np.divide(self.Y, eps+ self.B @ self.S) @ np.transpose(self.S))
-                self.S = np.multiply(np.divide(self.S, eps+ (2 * np.transpose(self.A) @ self.A @ self.S + \
-                                               self.lam * np.transpose(self.B) @ \
-                                               np.ones((classes,cols)))),2 * np.transpose(self.A) \
-                                     @ self.X + self.lam * np.transpose(self.B) @ \
-                                     np.divide(self.Y, eps+ self.B @ self.S))
-
-                if saveerrs:
-                    reconerrs[i] = la.norm(self.X - self.A @ self.S, 'fro')
-                    classerrs[i] = self.kldiv()
-                    errs[i] = reconerrs[i]**2 + self.lam * classerrs[i] #save errors
-                    classaccs[i] = self.accuracy()
-
-            print("Completed I-SSNMF for supervised learning without missing data.")
-            if saveerrs:
-                return [errs,reconerrs,classerrs,classaccs]
-
-
-        if self.L is None and self.W is not None:
-            for i in range(numiters):
-                #multiplicative updates for A, S, and B
-                self.A = np.multiply(np.divide(self.A,eps+ np.multiply(self.W, self.A @ self.S) @ np.transpose(self.S)), \
-                                     np.multiply(self.W, self.X) @ np.transpose(self.S))
-                self.B = np.multiply(np.divide(self.B,eps+ np.ones((classes,cols)) @ np.transpose(self.S)), \
-                                     np.divide(self.Y, eps+ self.B @ self.S) @ np.transpose(self.S))
-                self.S = np.multiply(np.divide(self.S, eps+ (2 * np.transpose(self.A) @ np.multiply(self.W, self.A @ self.S) + \
-                                               self.lam * np.transpose(self.B) @ \
-                                               np.ones((classes,cols)))),2 * np.transpose(self.A) \
-                                     @ np.multiply(self.W, self.X) + self.lam * np.transpose(self.B) @ \
-                                     np.divide(self.Y, eps+ self.B @ self.S))
-
-                if saveerrs:
-                    reconerrs[i] = la.norm(np.multiply(self.W,self.X) - np.multiply(self.W,self.A @ self.S), 'fro')
-                    classerrs[i] = self.kldiv()
-                    errs[i] = reconerrs[i]**2 + self.lam * classerrs[i] #save errors
-                    classaccs[i] = self.accuracy()
-
-            print("Completed I-SSNMF for supervised learning with missing data.")
-            if saveerrs:
-                return [errs,reconerrs,classerrs,classaccs]
-
-
-
-        if self.L is not None and self.W is None:
-            for i in range(numiters):
-                #multiplicative updates for A, S, and B
-                self.A = np.multiply(np.divide(self.A,eps+ self.A @ self.S @ np.transpose(self.S)), \
-                                     self.X @ np.transpose(self.S))
-                self.B = np.multiply(np.divide(self.B,eps+ self.L @ np.transpose(self.S)), \
-                                     np.divide(np.multiply(self.L, self.Y), eps+ np.multiply(self.L,self.B @ self.S)) @ np.transpose(self.S))
-                self.S = np.multiply(np.divide(self.S, eps+ (2 * np.transpose(self.A) @ self.A @ self.S + \
-                                               self.lam * np.transpose(self.B) @ \
-                                               self.L)),2 * np.transpose(self.A) \
-                                     @ self.X + self.lam * np.transpose(self.B) @ \
-                                     np.divide(np.multiply(self.L,self.Y), eps+ np.multiply(self.L,self.B @ self.S)))
-
-                if saveerrs:
-                    reconerrs[i] = la.norm(self.X - self.A @ self.S, 'fro')
-                    classerrs[i] = self.kldiv()
-                    errs[i] = reconerrs[i]**2 + self.lam * classerrs[i] #save errors
-                    classaccs[i] = self.accuracy()
-
-            print("Completed I-SSNMF for semi-supervised learning without missing data.")
-            if saveerrs:
-                return [errs,reconerrs,classerrs,classaccs]
-
-
-        if self.L is not None and self.W is not None:
-            for i in range(numiters):
-                #multiplicative updates for A, S, and B
-                self.A = np.multiply(np.divide(self.A,eps+ np.multiply(self.W,self.A @ self.S) @ np.transpose(self.S)), \
-                                     np.multiply(self.W,self.X) @ np.transpose(self.S))
-                self.B = np.multiply(np.divide(self.B,eps+ self.L @ np.transpose(self.S)), \
-                                     np.divide(np.multiply(self.L, self.Y), eps+ np.multiply(self.L,self.B @ self.S)) @ np.transpose(self.S))
-                self.S = np.multiply(np.divide(self.S, eps+ (2 * np.transpose(self.A) @ np.multiply(self.W, self.A @ self.S) + \
-                                               self.lam * np.transpose(self.B) @ \
-                                               self.L)),2 * np.transpose(self.A) \
-                                     @ np.multiply(self.W,self.X) + self.lam * np.transpose(self.B) @ \
-                                     np.divide(np.multiply(self.L,self.Y), eps+ np.multiply(self.L,self.B @ self.S)))
-
-                if saveerrs:
-                    reconerrs[i] = la.norm(np.multiply(self.W,self.X) - np.multiply(self.W,self.A @ self.S), 'fro')
-                    classerrs[i] = self.kldiv()
-                    errs[i] = reconerrs[i]**2 + self.lam * classerrs[i] #save errors
-                    classaccs[i] = self.accuracy()
-
-            print("Completed I-SSNMF for semi-supervised learning with missing data.")
-            if saveerrs:
-                return [errs,reconerrs,classerrs,classaccs]
+        W = self.W if self._Wsp is None else self._Wsp
+        buf = self._buffers(saveerrs, pool, labels=True)
+        for i in range(numiters):
+            saveerr = saveerrs and ((i+1) % errevery == 0 or i == numiters-1)
+            #multiplicative updates for A, S, and B
+            self._klsnmf_step(xp, self.A, self.S, self.B, self.X, self.Y, W, self.L, self.lam, eps, buf, pool)
 
+            if saveerr:
+                j = i // errevery
+                reconerrs[j] = self._reconerr(xp, self.A, self.S, self.X, W, buf, pool)
+                classerrs[j] = self.kldiv()
+                errs[j] = reconerrs[j]**2 + self.lam * classerrs[j] #save errors
+                classaccs[j] = self.accuracy()
+
+        print("Completed I-SSNMF for %s learning %s missing data." % \
+              ('supervised' if self.L is None else 'semi-supervised', 'without' if self.W is None else 'with'))
+
+        if saveerrs:
+            return [errs,reconerrs,classerrs,classaccs]
 
     def accuracy(self,**kwargs):
         '''
@@ -516,39 +874,32 @@ class SSNMF:
 
         if self.Y is None:
             raise Exception('Label matrix Y not provided: model is not semi-supervised.')
+        xp = self.xp
 
         if self.L is None:
             #count number of data points which are correctly classified
-            numdata = np.shape(self.Y)[1]
-            numacc = 0
-            Yhat = self.B @ self.S
-            for i in range(numdata):
-                true_max = np.argmax(self.Y[:,i])
-                approx_max = np.argmax(Yhat[:,i])
-
-                if true_max == approx_max:
-                    numacc = numacc + 1
+            true_max = xp.argmax(self.Y, axis=0)
+            approx_max = xp.argmax(self.B @ self.S, axis=0)
 
             #return fraction of correctly classified data points
-            acc = numacc/numdata
+            acc = float(xp.mean(true_max == approx_max))
             return acc
 
         if self.L is not None:
             #count number of data points which are correctly classified
-            numdata = np.shape(self.Y)[1]
-            num_labels = numdata
-            numacc = 0
-
-            Yhat = np.multiply(self.L, self.B @ self.S)
-            for i in range(numdata):
-                true_max = np.argmax(np.multiply(self.L,self.Y)[:,i])
-                approx_max = np.argmax(Yhat[:,i])
-
-                if (true_max == approx_max and np.multiply(self.L,self.Y)[true_max,i] != 0):
-                    numacc = numacc + 1
-
-                if (true_max == approx_max and np.multiply(self.L,self.Y)[true_max,i] == 0):
-                    num_labels = num_labels - 1
+            numdata = self.Y.shape[1]
+            LY = xp.multiply(self.L, self.Y)
+            true_max = xp.argmax(LY, axis=0)
+            LBS = self.B @ self.S
+            LBS *= self.L
+            approx_max = xp.argmax(LBS, axis=0)
+            #a point has a known label if its largest masked label entry is nonzero
+            correct = true_max == approx_max
+            labeled = LY[true_max, xp.arange(numdata)] != 0
+
+            #correct points without a known label do not count towards the accuracy
+            numacc = int(xp.sum(correct & labeled))
+            num_labels = numdata - int(xp.sum(correct & ~labeled))
 
             #return fraction of correctly classified data points
             acc = numacc/num_labels
@@ -568,24 +919,30 @@ class SSNMF:
         kldiv : float_
             I-divergence between Y and BS.
         '''
-        eps = kwargs.get('eps', 1e-10)
+        eps = self.dtype.type(kwargs.get('eps', 1e-10))
 
         if self.Y is None:
             raise Exception('Label matrix Y not provided: model is not semi-supervised.')
+        xp = self.xp
 
 
         if self.L is None:
             #compute divergence
+            Ytrue = self.Y
             Yhat = self.B @ self.S
-            div = np.multiply(self.Y, np.log(np.divide(self.Y+eps, Yhat+eps))) - self.Y + Yhat
-            kldiv = np.sum(np.sum(div))
-            return kldiv
-
 
         if self.L is not None:
             #compute divergence when there is missing labels
-            Yhat = np.multiply(self.L,self.B @ self.S)
-            div = np.multiply(np.multiply(self.L, self.Y), np.log(np.divide(np.multiply(self.L, self.Y)+eps, Yhat+eps))) \
-                -np.multiply(self.L,self.Y) + Yhat
-            kldiv = np.sum(np.sum(div))
-            return kldiv
+            Ytrue = xp.multiply(self.L, self.Y)
+            Yhat = self.B @ self.S
+            Yhat *= self.L
+
+        #the -Y + Yhat terms sum separately; the log term is formed in place in one scratch array
+        kldiv = float(Yhat.sum(dtype=np.float64)) - float(Ytrue.sum(dtype=np.float64))
+        Yhat += eps
+        div = Ytrue + eps
+        div /= Yhat
+        xp.log(div, out=div)
+        div *= Ytrue
+        kldiv += float(div.sum(dtype=np.float64))
+        return kldiv
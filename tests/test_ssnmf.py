@@ -0,0 +1,258 @@
+import numpy as np
+import pytest
+
+from ssnmf import SSNMF
+from ssnmf import ssnmf as ssnmf_module
+
+
+def lowrank_data(m=300, n=500, p=4, k=6, seed=0):
+    rng = np.random.RandomState(seed)
+    A = rng.rand(m, k)
+    S = rng.rand(k, n)
+    Y = np.eye(p)[rng.randint(p, size=n)].T
+    return A, S, A @ S, Y
+
+
+def residual(model):
+    A = model.A.astype(np.float64)
+    S = model.S.astype(np.float64)
+    return np.linalg.norm(model.X.astype(np.float64) - A @ S)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+@pytest.mark.parametrize("method", ["mult", "snmfmult", "klsnmfmult"])
+def test_reconerrs_match_residual(method, dtype):
+    # start next to an exact factorization, where ||X - AS|| is small relative to ||X||
+    A, S, X, Y = lowrank_data()
+    S = S * (1 + 1e-4 * np.random.RandomState(1).rand(*S.shape))
+    kwargs = {} if method == "mult" else {"Y": Y, "lam": 1e-3}
+    model = SSNMF(X, 6, A=A, S=S, dtype=dtype, **kwargs)
+    out = getattr(model, method)(numiters=5, saveerrs=True)
+    reconerr = out[0][-1] if method == "mult" else out[1][-1]
+
+    rtol = 1e-3 if dtype == np.float32 else 1e-10
+    assert reconerr == pytest.approx(residual(model), rel=rtol)
+
+
+def reference(method, X, A, S, numiters, Y=None, B=None, W=None, L=None, lam=1, eps=1e-10):
+    # the multiplicative updates written out directly, with missing masks taken as all ones
+    W = np.ones_like(X) if W is None else W
+    if Y is not None:
+        L = np.ones_like(Y) if L is None else L
+    reconerrs = []
+    for i in range(numiters):
+        A = A / (eps + (W * (A @ S)) @ S.T) * ((W * X) @ S.T)
+        if method == "snmfmult":
+            B = B / (eps + (L * (B @ S)) @ S.T) * ((L * Y) @ S.T)
+        elif method == "klsnmfmult":
+            B = B / (eps + L @ S.T) * (((L * Y) / (eps + L * (B @ S))) @ S.T)
+        if method == "mult":
+            S = S / (eps + A.T @ (W * (A @ S))) * (A.T @ (W * X))
+        elif method == "snmfmult":
+            S = S / (eps + A.T @ (W * (A @ S)) + lam * B.T @ (L * (B @ S))) \
+                * (A.T @ (W * X) + lam * B.T @ (L * Y))
+        else:
+            S = S / (eps + 2 * A.T @ (W * (A @ S)) + lam * B.T @ L) \
+                * (2 * A.T @ (W * X) + lam * B.T @ ((L * Y) / (eps + L * (B @ S))))
+        reconerrs.append(np.linalg.norm(W * X - W * (A @ S)))
+    return A, S, B, np.array(reconerrs)
+
+
+def masks(X, Y, seed=0):
+    # W below and above the density where the sparse mask path is used
+    rng = np.random.RandomState(seed)
+    density = ssnmf_module._SPARSE_DENSITY
+    sparseW = (rng.rand(*X.shape) < density / 2).astype(float)
+    denseW = (rng.rand(*X.shape) < (1 + density) / 2).astype(float)
+    L = np.ones_like(Y)
+    L[:, rng.rand(Y.shape[1]) < 0.3] = 0
+    return [None, sparseW, denseW], [None, L]
+
+
+@pytest.mark.parametrize("method", ["mult", "snmfmult", "klsnmfmult"])
+def test_updates_match_reference(method):
+    A, S, X, Y = lowrank_data(m=60, n=80)
+    X = X + 0.1 * np.random.RandomState(2).rand(*X.shape)
+    B = np.random.RandomState(3).rand(Y.shape[0], 6)
+    Ws, Ls = masks(X, Y)
+    for W in Ws:
+        for L in (Ls if method != "mult" else [None]):
+            kwargs = {"W": W, "L": L}
+            if method != "mult":
+                kwargs.update(Y=Y, B=B, lam=0.5)
+            model = SSNMF(X, 6, A=A, S=S, dtype=np.float64, **kwargs)
+            out = getattr(model, method)(numiters=20, saveerrs=True)
+            reconerrs = out[0] if method == "mult" else out[1]
+
+            refA, refS, refB, refreconerrs = reference(method, X, A, S, 20, **kwargs)
+            np.testing.assert_allclose(model.A, refA, rtol=1e-9)
+            np.testing.assert_allclose(model.S, refS, rtol=1e-9)
+            if method != "mult":
+                np.testing.assert_allclose(model.B, refB, rtol=1e-9)
+            np.testing.assert_allclose(reconerrs, refreconerrs, rtol=1e-9)
+
+
+def test_sparse_mask_path():
+    A, S, X, Y = lowrank_data(m=60, n=80)
+    sparseW, denseW = masks(X, Y)[0][1:]
+    assert SSNMF(X, 6, W=sparseW)._Wsp is not None
+    assert SSNMF(X, 6, W=denseW)._Wsp is None
+
+
+def test_dtype():
+    A, S, X, Y = lowrank_data(m=30, n=40)
+    model = SSNMF(X, 6, Y=Y)
+    assert model.X.dtype == model.A.dtype == model.S.dtype == model.B.dtype == np.float32
+    model = SSNMF(X, 6, Y=Y, dtype=np.float64)
+    assert model.X.dtype == model.A.dtype == model.S.dtype == model.B.dtype == np.float64
+    model.snmfmult(numiters=2)
+    assert model.A.dtype == model.S.dtype == model.B.dtype == np.float64
+
+
+@pytest.mark.parametrize("method", ["mult", "snmfmult", "klsnmfmult"])
+def test_errevery(method):
+    A, S, X, Y = lowrank_data(m=30, n=40)
+    kwargs = {} if method == "mult" else {"Y": Y, "B": np.ones((Y.shape[0], 6))}
+    every = getattr(SSNMF(X, 6, A=A, S=S, dtype=np.float64, **kwargs), method)(numiters=10, saveerrs=True)
+    some = getattr(SSNMF(X, 6, A=A, S=S, dtype=np.float64, **kwargs), method)(numiters=10, saveerrs=True,
+                                                                              errevery=3)
+    # saved after iterations 3, 6, 9 and after the last one
+    for errs, errs3 in zip(every, some):
+        assert len(errs3) == 4
+        np.testing.assert_allclose(errs3, errs[[2, 5, 8, 9]], rtol=1e-12)
+
+
+@pytest.mark.parametrize("shape", ["tall", "wide"])
+@pytest.mark.parametrize("method", ["mult", "snmfmult", "klsnmfmult"])
+def test_numthreads(method, shape):
+    # large enough for several elementwise chunks and several row (tall) or column (wide) panels
+    k = 4
+    size = 3 * max(ssnmf_module._CHUNK // k, ssnmf_module._TILE_ROWS) + 7
+    m, n = (size, 20) if shape == "tall" else (20, size)
+    A, S, X, Y = lowrank_data(m=m, n=n, k=k)
+    W = (np.random.RandomState(4).rand(*X.shape) < 0.8).astype(float)
+    L = (np.random.RandomState(5).rand(n) < 0.7) * np.ones_like(Y)
+    for mask, labelmask in [(None, None), (W, None), (None, L), (W, L)]:
+        if method == "mult" and labelmask is not None:
+            continue
+        kwargs = {"W": mask} if method == "mult" else {"W": mask, "L": labelmask, "Y": Y,
+                                                       "B": np.ones((Y.shape[0], k))}
+        results = []
+        for numthreads in [1, 3]:
+            model = SSNMF(X, k, A=A, S=S, dtype=np.float64, **kwargs)
+            getattr(model, method)(numiters=3, numthreads=numthreads)
+            results.append((model.A, model.S))
+        np.testing.assert_allclose(results[1][0], results[0][0], rtol=1e-12)
+        np.testing.assert_allclose(results[1][1], results[0][1], rtol=1e-12)
+
+
+def test_panels():
+    # one panel per thread once each is at least the given width, else a single (or split) panel
+    pool = ssnmf_module._threadpool(4)
+    for n, split, expected in [(4 * 256, False, 4), (4 * 256 - 1, False, 1), (4 * 256 - 1, True, 4),
+                               (600, True, 3), (600, False, 1)]:
+        panels = []
+        ssnmf_module._panels(lambda p, pool: panels.append(p), pool, n, 256, split)
+        if ssnmf_module.ThreadpoolController is None:
+            expected = len(range(0, n, 256)) if split else 1
+        assert len(panels) == expected
+        assert sum(p.stop - p.start for p in panels) == n
+
+
+def test_masked_update_row_panels():
+    # tall enough for the dense-mask A update to run over several row panels
+    m = 2 * ssnmf_module._TILE_ROWS + 7
+    A, S, X, Y = lowrank_data(m=m, n=30)
+    denseW = masks(X, Y)[0][2]
+    model = SSNMF(X, 6, A=A, S=S, W=denseW, dtype=np.float64)
+    model.mult(numiters=10)
+    refA, refS, _, _ = reference("mult", X, A, S, 10, W=denseW)
+    np.testing.assert_allclose(model.A, refA, rtol=1e-9)
+    np.testing.assert_allclose(model.S, refS, rtol=1e-9)
+
+
+@pytest.mark.parametrize("method", ["mult", "snmfmult"])
+def test_sparse_data(method):
+    sparse = pytest.importorskip("scipy.sparse")
+    A, S, X, Y = lowrank_data(m=50, n=60)
+    X[X < np.median(X)] = 0
+    kwargs = {} if method == "mult" else {"Y": Y, "B": np.ones((Y.shape[0], 6))}
+    dense = SSNMF(X, 6, A=A, S=S, dtype=np.float64, **kwargs)
+    csr = SSNMF(sparse.csr_matrix(X), 6, A=A, S=S, dtype=np.float64, **kwargs)
+    assert isinstance(csr.X, np.ndarray)
+    errs = getattr(dense, method)(numiters=5, saveerrs=True)
+    csrerrs = getattr(csr, method)(numiters=5, saveerrs=True)
+    np.testing.assert_allclose(csr.A, dense.A, rtol=1e-12)
+    np.testing.assert_allclose(csr.S, dense.S, rtol=1e-12)
+    for e, ce in zip(errs, csrerrs):
+        np.testing.assert_allclose(ce, e, rtol=1e-12)
+
+
+def accuracy_reference(Y, BS, L=None):
+    # the point-by-point count; with L, correct points without a known label leave the denominator
+    if L is None:
+        return np.mean([np.argmax(Y[:, i]) == np.argmax(BS[:, i]) for i in range(Y.shape[1])])
+    LY, LBS = L * Y, L * BS
+    numacc, num_labels = 0, Y.shape[1]
+    for i in range(Y.shape[1]):
+        true_max, approx_max = np.argmax(LY[:, i]), np.argmax(LBS[:, i])
+        if true_max == approx_max and LY[true_max, i] != 0:
+            numacc += 1
+        elif true_max == approx_max:
+            num_labels -= 1
+    return numacc / num_labels
+
+
+def kldiv_reference(Y, BS, L=None, eps=1e-10):
+    L = np.ones_like(Y) if L is None else L
+    LY, LBS = L * Y, L * BS
+    return np.sum(LY * np.log((LY + eps) / (LBS + eps)) - LY + LBS)
+
+
+def label_model(Y, BS, L=None):
+    # B = I, so that BS is the given matrix
+    p, n = Y.shape
+    return SSNMF(np.ones((2, n)), p, Y=Y, L=L, B=np.eye(p), S=BS, dtype=np.float64)
+
+
+def test_accuracy_and_kldiv():
+    Y = np.eye(3)[[0, 1, 2, 0, 1, 2, 0, 1]].T
+    BS = np.array([[.5, .2, .1, .3, .4, .2, 0, .3],
+                   [.2, .6, .1, .3, .4, .2, 0, .3],
+                   [.1, .1, .7, .3, .1, .6, 0, .1]])
+    L = np.ones_like(Y)
+    L[:, 5] = 0  # unknown label, argmax ties at 0 on both sides, so correct but unlabelled
+    L[0, 3] = 0  # known label masked out of its own row
+    L[1, 7] = 0
+    for mask in [None, L]:
+        model = label_model(Y, BS, mask)
+        assert model.accuracy() == pytest.approx(accuracy_reference(Y, BS, mask), rel=1e-12)
+        assert model.kldiv() == pytest.approx(kldiv_reference(Y, BS, mask), rel=1e-12)
+    # ties go to the first class (points 3, 4, 6 and 7); with L, points 5 and 7 are correct
+    # without a known label and leave the denominator
+    assert label_model(Y, BS).accuracy() == pytest.approx(6 / 8)
+    assert label_model(Y, BS, L).accuracy() == pytest.approx(4 / 6)
+
+    rng = np.random.RandomState(6)
+    Y = np.eye(4)[rng.randint(4, size=200)].T
+    BS = rng.rand(4, 200)
+    L = np.ones_like(Y)
+    L[:, rng.rand(200) < 0.3] = 0
+    for mask in [None, L]:
+        model = label_model(Y, BS, mask)
+        assert model.accuracy() == pytest.approx(accuracy_reference(Y, BS, mask), rel=1e-12)
+        assert model.kldiv() == pytest.approx(kldiv_reference(Y, BS, mask), rel=1e-12)
+
+
+@pytest.mark.parametrize("method", ["snmfmult", "klsnmfmult"])
+def test_classerrs(method):
+    A, S, X, Y = lowrank_data(m=40, n=50)
+    L = masks(X, Y)[1][1]
+    for mask in [None, L]:
+        model = SSNMF(X, 6, A=A, S=S, Y=Y, L=mask, B=np.ones((Y.shape[0], 6)), dtype=np.float64)
+        errs, reconerrs, classerrs, classaccs = getattr(model, method)(numiters=3, saveerrs=True)
+        BS = model.B @ model.S
+        Lmask = np.ones_like(Y) if mask is None else mask
+        classerr = np.linalg.norm(Lmask * (Y - BS)) if method == "snmfmult" else kldiv_reference(Y, BS, mask)
+        assert classerrs[-1] == pytest.approx(classerr, rel=1e-9)
+        assert classaccs[-1] == pytest.approx(accuracy_reference(Y, BS, mask), rel=1e-12)